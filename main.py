@@ -1,28 +1,68 @@
 import asyncio
+import contextlib
+import hashlib
+import io
+import json
+import math
 import os
+import re
 import signal
+import sqlite3
+import textwrap
 import time
-from datetime import datetime, timedelta
+from dataclasses import dataclass
+from datetime import datetime, timedelta, timezone
+from operator import attrgetter
+from zoneinfo import ZoneInfo
 
-import pytz
 from google import genai
 from google.genai import types as genai_types
 from telethon import TelegramClient, functions, types
 from telethon.sessions import StringSession
-from telethon.errors.rpcerrorlist import ChatWriteForbiddenError, UserBannedInChannelError
+from telethon.errors.rpcerrorlist import (
+    ChatWriteForbiddenError,
+    FloodWaitError,
+    UserBannedInChannelError,
+)
 
 try:
     from dotenv import load_dotenv
 except ImportError:
     load_dotenv = None
 
-HK_TZ = pytz.timezone("Asia/Hong_Kong")
+try:
+    import uvloop
+except ImportError:
+    uvloop = None
+
+HK_TZ = ZoneInfo("Asia/Hong_Kong")
 TOPIC_LIMIT = 50
 MAX_MESSAGES_PER_TOPIC = 5000
-CHUNK_SIZE = 1000  # Messages per chunk for large topics
-CHUNK_DELAY_SECONDS = 5  # Short delay between API calls
+CHUNK_MAX_CHARS = 60_000  # Formatted input per chunk for large topics (~1 token per CJK char)
+MESSAGE_LINE_OVERHEAD = 22  # "\n[YYYY-MM-DD HH:MM] " plus ": " around sender and text
+REDUCE_FANOUT = 8  # Partial summaries merged per reduce call for very large topics
 FALLBACK_MESSAGES = 500
+MIN_SUMMARY_MESSAGES = 3  # Topics below both minimums are reported as no activity
+MIN_SUMMARY_CHARS = 50
+SEARCH_PAGE_SIZE = 100
+MAX_PARALLEL_PAGES = 8  # Concurrent id ranges fetched per topic
 DEFAULT_MODEL_CALL_TIMEOUT_SECONDS = 45
+DEFAULT_GEMINI_CONCURRENCY = 5  # Gemini requests in flight at once
+DEFAULT_GEMINI_RPM = 10  # Requests per minute allowed per key and model; 0 disables pacing
+RATE_LIMIT_MIN_FRACTION = 0.1  # Repeated 429s never slow a key/model below this share of GEMINI_RPM
+RATE_LIMIT_RECOVERY_SECONDS = 120  # A throttled rate climbs back to GEMINI_RPM over this long
+DEFAULT_TOPIC_CONCURRENCY = 8  # Topics fetched at the same time (summaries are bounded by GEMINI_CONCURRENCY)
+STREAM_EDIT_INTERVAL_SECONDS = 3  # Min gap between edits of a streamed summary
+TELEGRAM_CONCURRENCY = 3  # Raw Telegram requests in flight at once
+FLOOD_WAIT_RETRIES = 3
+PIPELINE_QUEUE_SIZE = 4  # Items buffered between fetch, summarize and send stages
+BATCH_MAX_TOPICS = 10  # Small topics summarized together in one Gemini call
+BATCH_MAX_CHARS = 200_000  # Input budget for a single batched call
+BATCH_MODEL_ATTEMPTS = 2  # Models tried for a batch before falling back per topic
+BATCH_TIMEOUT_FACTOR = 2  # Batched calls get a longer timeout than single topics
+DEFAULT_SUMMARY_CACHE_PATH = ".summary_cache.sqlite3"
+SUMMARY_CACHE_MAX_AGE_SECONDS = 7 * 24 * 3600  # Cached summaries older than this are evicted
+SUMMARY_CACHE_MAX_ROWS = 5000
 
 RUN_START_MONO = time.monotonic()
 RUNTIME_STATE = {
@@ -89,6 +129,94 @@ MODELS_TO_TRY = [
     "gemini-flash-latest",
 ]
 
+# Prompt templates are built once at import; only the placeholders change per call
+PREAMBLE_TEMPLATE = textwrap.dedent("""
+    # Role
+    你是由「Crypto Farming Group」指派的高級鏈上分析師與會議秘書。你具備深厚的 DeFi、Airdrop、MEV 及合約交互知識。
+    你的任務是從雜亂的社群對話中，提煉出高價值的「Alpha 資訊」與「操作策略」。
+
+    # Context
+    * **今日日期**: {current_date}
+    * **時間範圍**: {timeframe_label}
+    * **核心術語庫**: Wash trading (自成交), Sybil (女巫), Gas Optimization, Binance Alpha, LP, Slippage.
+    * **KOL**: 用户 "笑苍生" 是本群精神領袖。
+
+    # Constraints (Critical)
+    1.  **输出语言 (Output Language)**: **必须使用简体中文**输出所有内容。这是强制要求，无例外。
+    2.  **絕對真實 (Zero Hallucination)**: 總結內容**必須嚴格基於**提供的 `Input Data`。嚴禁編造未在對話中出現的項目名稱、價格預測或操作建議。
+    3.  **來源歸屬 (Attribution)**: 
+        * 每一條【重點摘要】和【待辦事項】都**必須**標註來源。
+        * 格式：`— (@username)`。
+        * 若該觀點由多人共同完善，標註主要發起人即可；若無法確定，標註 `— (多人討論)`。
+        * **例外**：【笑苍生说】區塊**不需要**標註 @username（因他是已知 KOL）。
+    4.  **待辦識別 (Actionable Intel)**: 
+        * 僅提取**具有時效性**的群體任務（如：Snapshot 時間、Mint 截止、AMA 開始）。
+        * **日期處理**：將「明天」、「這週日」轉換為具體日期（MM月DD日）。如果無法確定具體日期，請**保留原文描述**，不要強行猜測。
+    5.  **時間標註 (Timestamp Attribution)**:
+        * 每一條【重點摘要】都**必須**標註該討論發生的時間範圍，格式：`[HH:MM-HH:MM]`。
+        * 使用**主要討論時段**的時間。若某議題在多個不連續時段被大量討論（如 14:00 和 18:00），請**拆分為兩條獨立的摘要**，各自標註其時間範圍。
+    6.  **KOL 優先**: 只要 "笑苍生" 有發言，無論長短，必須在專屬區塊中精確轉述。
+    7.  **噪音過濾**: 自動忽略 "GM", "GN", 表情包, 情緒宣洩 (FUD/FOMO) 及無關閒聊。
+
+    # Workflow
+    1.  **掃描與過濾**: 閱讀對話，剔除噪音。
+    2.  **KOL 提取**: 鎖定 "笑苍生" 的所有指令與觀點。
+    3.  **信息結構化**:
+        * 提取熱門項目的核心爭議或亮點。
+        * 提取具體技術細節（Gas 設置、路徑）並綁定發言者 ID。
+    4.  **時效性掃描**: 尋找關鍵詞（截止、快照、claim、填表），生成待辦清單。
+    5.  **輸出生成**: 按下方格式輸出。
+
+    # Output Format
+    請嚴格遵守以下格式，列表符號統一使用 "-"：
+
+    🗓️ **时间范围**: {timeframe_label}
+
+    🔥 **热门话题** (Top Discussed)
+    - [項目/代幣名稱]: [一句話概括核心討論點]
+    - (若無熱點則寫 "無特別熱點")
+
+    🗣️ **笑苍生说** (KOL Insights)
+    - [精確轉述他的觀點、指令或判斷]
+    - (若此段時間他未發言，請直接移除此區塊)
+
+    📝 **重点摘要** (Key Takeaways)
+    - [HH:MM-HH:MM] [技術/策略]: [詳細說明] — *(@username)*
+    - [HH:MM-HH:MM] [風險警示]: [例如：合約有後門、查女巫嚴格] — *(@username)*
+
+    ⏰ **待辦事項** (Action Items)
+    - 📅 [MM-DD 或 原文時間]: [具體行動，如：去 Galxe 領取 OAT] — *(@username 提醒)*
+    - (若無時限性任務則不顯示此區塊)
+""")
+
+TOPIC_PROMPT_TEMPLATE = textwrap.dedent("""
+    # Topic
+    * **對話主題**: {topic_name}
+
+    ---
+    **Input Data**:
+    {text_data}
+""")
+
+BATCH_PROMPT_TEMPLATE = textwrap.dedent("""
+    # Batch Mode
+    本次輸入包含 {topic_count} 個話題，每個話題以 `<<<TOPIC id=N name=...>>>` 開頭、`<<<END TOPIC id=N>>>` 結尾。
+    請對**每個話題分別**按上述規則與格式生成總結，不同話題的內容不可混用。
+    只輸出一個 JSON 物件：鍵為話題 id（字串），值為該話題的完整總結文本。不要輸出任何其他內容。
+
+    ---
+    **Input Data**:
+    {sections}
+""")
+
+PREAMBLE_CACHE_TTL = "3600s"  # Context cache lifetime; deleted at the end of a run anyway
+# (api_key, model_name, preamble) -> task resolving to a cache name, or None if unavailable
+PREAMBLE_CACHES: dict[tuple[str, str, str], asyncio.Future] = {}
+GEMINI_CLIENTS: dict[str, genai.Client] = {}
+KEYS_IN_FLIGHT: dict[str, int] = {}  # api_key -> Gemini calls using or waiting on it
+RATE_LIMITERS: dict[tuple[str, str], "RateLimiter"] = {}  # (api_key, model_name) -> limiter
+RETRY_DELAY_RE = re.compile(r"retryDelay['\"]?\s*:\s*['\"]?(\d+(?:\.\d+)?)s")
+
 SYSTEM_INSTRUCTION = (
     "You are an AI assistant that summarizes Telegram discussions. "
     "If any content violates safety guidelines, ignore that part and continue. Never refuse the entire task."
@@ -144,35 +272,65 @@ def get_cutoff_time() -> datetime:
         window_hours = 3.5
     
     print(f"Using dynamic window: {window_hours} hours")
-    return datetime.now(tz=pytz.UTC) - timedelta(hours=window_hours)
+    return datetime.now(tz=timezone.utc) - timedelta(hours=window_hours)
+
+
+async def call_telegram(client: TelegramClient, request, tg_sem: asyncio.Semaphore):
+    """
+    Invoke a raw Telegram request under the shared request semaphore.
+    Flood waits longer than Telethon's own auto-sleep threshold surface as
+    FloodWaitError; sleep for the requested time (outside the semaphore) and retry.
+    """
+    for attempt in range(FLOOD_WAIT_RETRIES + 1):
+        try:
+            async with tg_sem:
+                return await client(request)
+        except FloodWaitError as exc:
+            if attempt >= FLOOD_WAIT_RETRIES:
+                raise
+            log(
+                f"Flood wait {exc.seconds}s on {type(request).__name__} "
+                f"(retry {attempt + 1}/{FLOOD_WAIT_RETRIES})"
+            )
+            await asyncio.sleep(exc.seconds + 1)
 
 
-async def fetch_topics(client: TelegramClient, target) -> tuple[list[types.ForumTopic], int]:
+async def fetch_topics(
+    client: TelegramClient, peer, tg_sem: asyncio.Semaphore
+) -> tuple[list[types.ForumTopic], int, dict[int, datetime]]:
+    """
+    List the group's forum topics.
+    Returns: (topics, total_count, last_activity) where last_activity maps a
+    topic id to the date of its latest message, when Telegram included it.
+    """
     topics: list[types.ForumTopic] = []
     seen_topic_ids: set[int] = set()
+    last_activity: dict[int, datetime] = {}
     offset_date = None
     offset_id = 0
     offset_topic = 0
     total_count = 0
 
     while True:
-        result = await client(
+        result = await call_telegram(
+            client,
             functions.messages.GetForumTopicsRequest(
-                peer=target,
+                peer=peer,
                 offset_date=offset_date,
                 offset_id=offset_id,
                 offset_topic=offset_topic,
                 limit=TOPIC_LIMIT,
                 q=None,
-            )
+            ),
+            tg_sem,
         )
         if not total_count:
             total_count = getattr(result, "count", 0) or 0
 
         batch = [
             t
-            for t in (result.topics or [])
-            if isinstance(t, types.ForumTopic) and getattr(t, "top_message", None)
+            for t in result.topics or ()
+            if isinstance(t, types.ForumTopic) and t.top_message
         ]
         if not batch:
             break
@@ -188,6 +346,13 @@ async def fetch_topics(client: TelegramClient, target) -> tuple[list[types.Forum
             break
 
         topics.extend(new_batch)
+        # top_message is the topic's latest message; the page carries those messages
+        message_dates = {
+            m.id: m.date for m in result.messages or () if getattr(m, "date", None)
+        }
+        for topic in new_batch:
+            if topic.top_message in message_dates:
+                last_activity[topic.id] = message_dates[topic.top_message]
 
         if total_count and len(topics) >= total_count:
             break
@@ -198,230 +363,590 @@ async def fetch_topics(client: TelegramClient, target) -> tuple[list[types.Forum
         offset_id = last_topic.top_message or 0
         offset_topic = last_topic.id
         offset_date = None
-        for message in getattr(result, "messages", []) or []:
-            if getattr(message, "id", None) == last_topic.top_message:
+        for message in result.messages or ():
+            if message.id == last_topic.top_message:
+                # MessageEmpty carries no date
                 offset_date = getattr(message, "date", None)
                 break
 
         if offset_id == 0 and offset_topic == 0:
             break
 
-    return topics, total_count
+    return topics, total_count, last_activity
 
 
 def can_speak_in_topic(topic: types.ForumTopic) -> bool:
     return not getattr(topic, "closed", False)
 
 
+@dataclass(slots=True)
+class ChatMessage:
+    id: int
+    sender: str
+    text: str
+    time: datetime
+
+
+# Attribute precedence for sender labels: (attribute, label template)
+USER_LABEL_ATTRS = (("username", "@{}"), ("first_name", "{}"), ("id", "{}"))
+CHAT_LABEL_ATTRS = (("title", "{}"), ("username", "@{}"), ("id", "{}"))
+# from_id peer type -> its id field; one dict lookup per message instead of isinstance checks
+PEER_ID_GETTERS = {
+    types.PeerUser: attrgetter("user_id"),
+    types.PeerChannel: attrgetter("channel_id"),
+    types.PeerChat: attrgetter("chat_id"),
+}
+
+
+def entity_label(entity, label_attrs: tuple[tuple[str, str], ...]) -> str:
+    for attr, template in label_attrs:
+        value = getattr(entity, attr, None)
+        if value:
+            return template.format(value)
+    return "Unknown"
+
+
 async def fetch_messages_for_topic(
-    client: TelegramClient, target, topic: types.ForumTopic, cutoff_utc: datetime
-) -> tuple[list[dict], bool]:
-    """Collect recent text/url messages for a single topic."""
+    client: TelegramClient,
+    input_peer,
+    topic: types.ForumTopic,
+    cutoff_utc: datetime,
+    entity_cache: dict[int, str],
+    tg_sem: asyncio.Semaphore,
+    reference_hits: dict[str, int] | None = None,
+) -> tuple[list[ChatMessage], bool]:
+    """
+    Collect recent text/url messages for a single topic.
+    entity_cache is shared across topics so sender labels resolved once are reused.
+    reference_hits counts which topic reference the server answered for, so later
+    topics in the same group try that one first.
+    """
     collected = []
-    input_peer = await client.get_input_entity(target)
-    entity_cache: dict[int, str] = {}
+    seen_ids: set[int] = set()
+    min_ts = int(cutoff_utc.timestamp())
+    capped = False  # A range stopped early because the cap was already reached
 
     def cache_entities(result) -> None:
-        for user in getattr(result, "users", []) or []:
-            label = "Unknown"
-            if getattr(user, "username", None):
-                label = f"@{user.username}"
-            elif getattr(user, "first_name", None):
-                label = user.first_name
-            elif getattr(user, "id", None):
-                label = str(user.id)
-            entity_cache[user.id] = label
-
-        for chat in getattr(result, "chats", []) or []:
-            label = "Unknown"
-            if getattr(chat, "title", None):
-                label = chat.title
-            elif getattr(chat, "username", None):
-                label = f"@{chat.username}"
-            elif getattr(chat, "id", None):
-                label = str(chat.id)
-            entity_cache[chat.id] = label
+        # The cache is shared across topics (and concurrent ranges); labels are
+        # idempotent, so known ids are skipped and races are harmless.
+        for user in result.users or ():
+            if user.id not in entity_cache:
+                entity_cache[user.id] = entity_label(user, USER_LABEL_ATTRS)
+        for chat in result.chats or ():
+            if chat.id not in entity_cache:
+                entity_cache[chat.id] = entity_label(chat, CHAT_LABEL_ATTRS)
 
     def resolve_sender_label(message) -> str:
-        peer = getattr(message, "from_id", None)
-        if not peer:
-            return "Unknown"
-        peer_id = None
-        if hasattr(peer, "user_id") and peer.user_id:
-            peer_id = peer.user_id
-        elif hasattr(peer, "channel_id") and peer.channel_id:
-            peer_id = peer.channel_id
-        elif hasattr(peer, "chat_id") and peer.chat_id:
-            peer_id = peer.chat_id
-        if peer_id is None:
+        peer = message.from_id
+        peer_id_of = PEER_ID_GETTERS.get(type(peer))
+        if peer_id_of is None:
             return "Unknown"
+        peer_id = peer_id_of(peer)
         return entity_cache.get(peer_id, str(peer_id))
 
-    async def collect_for_top(top_reference: int) -> None:
-        offset_id = 0
-        page = 0
-        max_pages = 50
-
-        while page < max_pages:
-            result = await client(
-                functions.messages.SearchRequest(
-                    peer=input_peer,
-                    q="",
-                    filter=types.InputMessagesFilterEmpty(),
-                    min_date=None,
-                    max_date=None,
-                    offset_id=offset_id,
-                    add_offset=0,
-                    limit=100,
-                    max_id=0,
-                    min_id=0,
-                    hash=0,
-                    top_msg_id=top_reference,
-                )
-            )
-
-            messages = result.messages or []
-            if not messages:
-                break
+    async def search_page(top_reference: int, offset_id: int, min_id: int = 0):
+        return await call_telegram(
+            client,
+            functions.messages.SearchRequest(
+                peer=input_peer,
+                q="",
+                filter=types.InputMessagesFilterEmpty(),
+                min_date=min_ts,
+                max_date=None,
+                offset_id=offset_id,
+                add_offset=0,
+                limit=SEARCH_PAGE_SIZE,
+                max_id=0,
+                min_id=min_id,
+                hash=0,
+                top_msg_id=top_reference,
+            ),
+            tg_sem,
+        )
 
-            cache_entities(result)
+    def collect_page(messages) -> bool:
+        """Append in-window messages from a page. Returns True once the cutoff is crossed."""
+        for message in messages:
+            if not message or not message.date:
+                continue
 
-            for message in messages:
-                if not message or not message.date:
-                    continue
+            # Pages are newest-first: everything after the first message older
+            # than the cutoff is older too, on this page and every later one.
+            # Telethon already decodes dates as aware UTC datetimes.
+            message_time_utc = message.date
+            if message_time_utc < cutoff_utc:
+                return True
 
-                message_time_utc = message.date.replace(tzinfo=pytz.UTC)
-                if message_time_utc < cutoff_utc:
-                    continue
+            if message.id in seen_ids:
+                continue
+            seen_ids.add(message.id)
 
-                text = (getattr(message, "message", "") or "").strip()
-                if not text:
-                    continue
+            text = (getattr(message, "message", "") or "").strip()
+            if not text:
+                continue
 
-                # Skip previous bot summaries to avoid feedback loops
-                if "[Summary]" in text or "#总结" in text:
-                    continue
+            # Skip previous bot summaries to avoid feedback loops
+            if "[Summary]" in text or "#总结" in text:
+                continue
 
-                collected.append(
-                    {
-                        "sender": resolve_sender_label(message),
-                        "text": text,
-                        "time": message_time_utc.astimezone(HK_TZ),
-                    }
+            collected.append(
+                ChatMessage(
+                    id=message.id,
+                    sender=resolve_sender_label(message),
+                    text=text,
+                    time=message_time_utc,
                 )
+            )
+        return False
 
-            offset_id = messages[-1].id
-            if messages[-1].date and messages[-1].date.replace(tzinfo=pytz.UTC) < cutoff_utc:
-                break
-            page += 1
+    async def collect_range(
+        top_reference: int, offset_id: int, min_id: int, kept: list[int], slot: int
+    ) -> int:
+        """
+        Paginate one id range. kept[slot] counts messages collected by this range;
+        lower slots hold newer ranges.
+        Returns the number of messages the server returned.
+        """
+        nonlocal capped
+
+        server_seen = 0
+        # min_date makes the server stop returning results at the cutoff, so a
+        # short or empty page (or the cutoff check below) ends the range without a page cap
+        pending = asyncio.ensure_future(search_page(top_reference, offset_id, min_id))
+        try:
+            while True:
+                result = await pending
+                pending = None
+                messages = result.messages or ()
+                if not messages:
+                    break
 
-    # Try with top_message first; if nothing collected, fall back to topic.id
-    await collect_for_top(topic.top_message)
-    if not collected and topic.id != topic.top_message:
-        await collect_for_top(topic.id)
+                server_seen += len(messages)
+                cache_entities(result)
+                # When a full page's oldest dated message is still inside the
+                # window the range continues, so request the next page before
+                # filtering this one. A short page, or one that reached min_id,
+                # already ends the range (the server applies min_date/min_id).
+                # Undated entries (MessageEmpty) can trail a page that has
+                # crossed the cutoff, so they don't count.
+                oldest_date = next((m.date for m in reversed(messages) if m and m.date), None)
+                if (
+                    len(messages) >= SEARCH_PAGE_SIZE
+                    and messages[-1].id > min_id + 1
+                    and (oldest_date is None or oldest_date >= cutoff_utc)
+                ):
+                    pending = asyncio.ensure_future(
+                        search_page(top_reference, messages[-1].id, min_id)
+                    )
+                collected_before = len(collected)
+                crossed = collect_page(messages)
+                kept[slot] += len(collected) - collected_before
+                if crossed or pending is None:
+                    break
+                # Everything left in this range is older than the messages already
+                # kept by it and the newer ranges; past the cap it would only be
+                # truncated away
+                if sum(kept[: slot + 1]) >= MAX_MESSAGES_PER_TOPIC:
+                    capped = True
+                    break
+        finally:
+            if pending is not None:
+                pending.cancel()
+        return server_seen
+
+    async def collect_for_top(top_reference: int) -> tuple[int, int]:
+        """Returns (messages collected, messages the server returned)."""
+        collected_before = len(collected)
+        result = await search_page(top_reference, 0)
+        messages = result.messages or ()
+        if not messages:
+            return 0, 0
+
+        cache_entities(result)
+        if collect_page(messages):
+            return len(collected) - collected_before, len(messages)
+
+        # The server applies min_date, so a short page is the whole window
+        if len(messages) < SEARCH_PAGE_SIZE:
+            return len(collected) - collected_before, len(messages)
+
+        # Slot 0 is the first page; ranges follow from newest to oldest
+        kept = [len(collected) - collected_before]
+        newest, oldest = messages[0], messages[-1]
+        if not (newest.date and oldest.date):
+            kept.append(0)
+            server_seen = len(messages) + await collect_range(top_reference, oldest.id, 0, kept, 1)
+            return len(collected) - collected_before, server_seen
+
+        # A full first page still inside the window: estimate how many more pages
+        # the window needs from its time density, then fetch disjoint id ranges
+        # concurrently. The last range is open-ended, so a low estimate only
+        # means it paginates a little further on its own.
+        id_span = max(newest.id - oldest.id, SEARCH_PAGE_SIZE)
+        time_span = max((newest.date - oldest.date).total_seconds(), 1.0)
+        remaining = (oldest.date - cutoff_utc).total_seconds()
+        ranges = min(MAX_PARALLEL_PAGES, max(1, math.ceil(remaining / time_span)))
+
+        uppers = [oldest.id - k * id_span for k in range(ranges)]
+        # Small or young groups run out of ids before the last range; min_id 0 means no bound
+        lowers = [max(0, upper - 1) for upper in uppers[1:]] + [0]
+        kept.extend(0 for _ in uppers)
+        range_seen = await asyncio.gather(
+            *(
+                collect_range(top_reference, upper, lower, kept, slot)
+                for slot, (upper, lower) in enumerate(zip(uppers, lowers), start=1)
+                if upper > 0
+            )
+        )
+        return len(collected) - collected_before, len(messages) + sum(range_seen)
+
+    # Try the reference that worked for earlier topics first (top_message by
+    # default); fall back to the other only if the server returned nothing at
+    # all. A topic whose recent messages were all filtered out (e.g. only
+    # earlier bot summaries) would return the same again.
+    if reference_hits is None:
+        reference_hits = {}
+    references = [("top_message", topic.top_message)]
+    if topic.id != topic.top_message:
+        references.append(("id", topic.id))
+    references.sort(key=lambda ref: -reference_hits.get(ref[0], 0))
+    for name, top_reference in references:
+        _, server_seen = await collect_for_top(top_reference)
+        if server_seen:
+            reference_hits[name] = reference_hits.get(name, 0) + 1
+            break
 
-    collected.sort(key=lambda m: m["time"])
-    truncated = False
+    collected.sort(key=attrgetter("time"))
+    truncated = capped
     if len(collected) > MAX_MESSAGES_PER_TOPIC:
         truncated = True
         collected = collected[-MAX_MESSAGES_PER_TOPIC:]
     return collected, truncated
 
 
-def format_messages(messages: list[dict], truncated: bool, timeframe_label: str) -> str:
-    formatted_messages = "\n".join(
-        f"[{m['time'].strftime('%Y-%m-%d %H:%M')}] {m['sender']}: {m['text']}"
-        for m in messages
-    )
-    note = f"时间范围：{timeframe_label}"
+def format_messages(messages: list[ChatMessage], truncated: bool, timeframe_label: str) -> str:
+    buf = io.StringIO()
+    buf.write(f"时间范围：{timeframe_label}")
     if truncated:
-        note += f"\n(仅包含最近 {len(messages)} 条消息，因长度限制进行了截断)"
-    return f"{note}\n{formatted_messages}"
+        buf.write(f"\n(仅包含最近 {len(messages)} 条消息，因长度限制进行了截断)")
 
+    # Times are stored in UTC and only converted here. Chatty topics repeat the
+    # same minute many times, so each minute is converted and formatted once.
+    stamps: dict[tuple[int, int, int, int, int], str] = {}
+    for m in messages:
+        t = m.time
+        minute = (t.year, t.month, t.day, t.hour, t.minute)
+        stamp = stamps.get(minute)
+        if stamp is None:
+            stamp = stamps[minute] = t.astimezone(HK_TZ).strftime("%Y-%m-%d %H:%M")
+        buf.write(f"\n[{stamp}] {m.sender}: {m.text}")
+    return buf.getvalue()
 
-def get_ai_summary(
-    client: genai.Client, topic_name: str, text_data: str, timeframe_label: str, model_name: str
-) -> tuple[str, str | None]:
+
+def transcript_chars(messages: list[ChatMessage]) -> int:
+    """Formatted size of messages without building the text (header excluded)."""
+    return sum(len(m.sender) + len(m.text) for m in messages) + MESSAGE_LINE_OVERHEAD * len(messages)
+
+
+def split_into_chunks(messages: list[ChatMessage]) -> list[list[ChatMessage]]:
+    """
+    Greedily pack messages into chunks whose formatted size stays under CHUNK_MAX_CHARS.
+    Chunks follow message order; a single oversized message gets a chunk of its own.
+    """
+    chunks: list[list[ChatMessage]] = []
+    current: list[ChatMessage] = []
+    current_chars = 0
+    for m in messages:
+        line_chars = len(m.sender) + len(m.text) + MESSAGE_LINE_OVERHEAD
+        if current and current_chars + line_chars > CHUNK_MAX_CHARS:
+            chunks.append(current)
+            current, current_chars = [], 0
+        current.append(m)
+        current_chars += line_chars
+    if current:
+        chunks.append(current)
+    return chunks
+
+
+def build_summary_preamble(timeframe_label: str) -> str:
+    """Instructions shared by every topic in a run (cacheable on the Gemini side)."""
     # 傳入 current_date 以便 AI 計算 "明天/下週" 的具體日期
     current_date = datetime.now(HK_TZ).strftime("%Y年%m月%d日 (%A)")
-    
-    prompt = f"""
-    # Role
-    你是由「Crypto Farming Group」指派的高級鏈上分析師與會議秘書。你具備深厚的 DeFi、Airdrop、MEV 及合約交互知識。
-    你的任務是從雜亂的社群對話中，提煉出高價值的「Alpha 資訊」與「操作策略」。
+    return PREAMBLE_TEMPLATE.format(current_date=current_date, timeframe_label=timeframe_label)
 
-    # Context
-    * **今日日期**: {current_date}
-    * **對話主題**: {topic_name}
-    * **時間範圍**: {timeframe_label}
-    * **核心術語庫**: Wash trading (自成交), Sybil (女巫), Gas Optimization, Binance Alpha, LP, Slippage.
-    * **KOL**: 用户 "笑苍生" 是本群精神領袖。
 
-    # Constraints (Critical)
-    1.  **输出语言 (Output Language)**: **必须使用简体中文**输出所有内容。这是强制要求，无例外。
-    2.  **絕對真實 (Zero Hallucination)**: 總結內容**必須嚴格基於**提供的 `{text_data}`。嚴禁編造未在對話中出現的項目名稱、價格預測或操作建議。
-    3.  **來源歸屬 (Attribution)**: 
-        * 每一條【重點摘要】和【待辦事項】都**必須**標註來源。
-        * 格式：`— (@username)`。
-        * 若該觀點由多人共同完善，標註主要發起人即可；若無法確定，標註 `— (多人討論)`。
-        * **例外**：【笑苍生说】區塊**不需要**標註 @username（因他是已知 KOL）。
-    4.  **待辦識別 (Actionable Intel)**: 
-        * 僅提取**具有時效性**的群體任務（如：Snapshot 時間、Mint 截止、AMA 開始）。
-        * **日期處理**：將「明天」、「這週日」轉換為具體日期（MM月DD日）。如果無法確定具體日期，請**保留原文描述**，不要強行猜測。
-    5.  **時間標註 (Timestamp Attribution)**:
-        * 每一條【重點摘要】都**必須**標註該討論發生的時間範圍，格式：`[HH:MM-HH:MM]`。
-        * 使用**主要討論時段**的時間。若某議題在多個不連續時段被大量討論（如 14:00 和 18:00），請**拆分為兩條獨立的摘要**，各自標註其時間範圍。
-    6.  **KOL 優先**: 只要 "笑苍生" 有發言，無論長短，必須在專屬區塊中精確轉述。
-    7.  **噪音過濾**: 自動忽略 "GM", "GN", 表情包, 情緒宣洩 (FUD/FOMO) 及無關閒聊。
+def build_topic_prompt(topic_name: str, text_data: str) -> str:
+    return TOPIC_PROMPT_TEMPLATE.format(topic_name=topic_name, text_data=text_data)
 
-    # Workflow
-    1.  **掃描與過濾**: 閱讀對話，剔除噪音。
-    2.  **KOL 提取**: 鎖定 "笑苍生" 的所有指令與觀點。
-    3.  **信息結構化**:
-        * 提取熱門項目的核心爭議或亮點。
-        * 提取具體技術細節（Gas 設置、路徑）並綁定發言者 ID。
-    4.  **時效性掃描**: 尋找關鍵詞（截止、快照、claim、填表），生成待辦清單。
-    5.  **輸出生成**: 按下方格式輸出。
 
-    # Output Format
-    請嚴格遵守以下格式，列表符號統一使用 "-"：
+def build_batch_topic_prompt(items: list[tuple[str, str]]) -> str:
+    """Build the per-call part of a batched prompt; items are (topic_name, text_data)."""
+    sections = "\n\n".join(
+        f"<<<TOPIC id={i} name={name}>>>\n{text}\n<<<END TOPIC id={i}>>>"
+        for i, (name, text) in enumerate(items)
+    )
+    return BATCH_PROMPT_TEMPLATE.format(topic_count=len(items), sections=sections)
 
-    🗓️ **时间范围**: {timeframe_label}
 
-    🔥 **热门话题** (Top Discussed)
-    - [項目/代幣名稱]: [一句話概括核心討論點]
-    - (若無熱點則寫 "無特別熱點")
+def build_generate_config(cache_name: str | None, **overrides) -> genai_types.GenerateContentConfig:
+    # A context cache already carries the system instruction and preamble
+    if cache_name:
+        return genai_types.GenerateContentConfig(
+            cached_content=cache_name,
+            safety_settings=SAFETY_SETTINGS,
+            temperature=0.3,
+            **overrides,
+        )
+    return genai_types.GenerateContentConfig(
+        system_instruction=SYSTEM_INSTRUCTION,
+        safety_settings=SAFETY_SETTINGS,
+        temperature=0.3,
+        **overrides,
+    )
 
-    🗣️ **笑苍生说** (KOL Insights)
-    - [精確轉述他的觀點、指令或判斷]
-    - (若此段時間他未發言，請直接移除此區塊)
 
-    📝 **重点摘要** (Key Takeaways)
-    - [HH:MM-HH:MM] [技術/策略]: [詳細說明] — *(@username)*
-    - [HH:MM-HH:MM] [風險警示]: [例如：合約有後門、查女巫嚴格] — *(@username)*
+async def create_preamble_cache(
+    client: genai.Client, model_name: str, preamble: str, timeout: float
+) -> str | None:
+    # The SDK has no default HTTP timeout; a stuck create would block every
+    # call sharing this key/model, so it is bounded like a model call
+    try:
+        cached = await asyncio.wait_for(
+            client.aio.caches.create(
+                model=model_name,
+                config=genai_types.CreateCachedContentConfig(
+                    contents=[preamble],
+                    system_instruction=SYSTEM_INSTRUCTION,
+                    ttl=PREAMBLE_CACHE_TTL,
+                    display_name="telegram-summary-preamble",
+                ),
+            ),
+            timeout=timeout,
+        )
+    except asyncio.TimeoutError:
+        log(f"Context cache unavailable model={model_name}: create timed out after {timeout}s")
+        return None
+    except Exception as exc:
+        # Typically the preamble is under the model's minimum cacheable size
+        log(f"Context cache unavailable model={model_name}: {exc}")
+        return None
+    log(f"Created context cache model={model_name} name={cached.name}")
+    return cached.name
 
-    ⏰ **待辦事項** (Action Items)
-    - 📅 [MM-DD 或 原文時間]: [具體行動，如：去 Galxe 領取 OAT] — *(@username 提醒)*
-    - (若無時限性任務則不顯示此區塊)
 
-    ---
-    **Input Data**:
-    {text_data}
+async def get_preamble_cache(
+    client: genai.Client, api_key: str, model_name: str, preamble: str, timeout: float
+) -> str | None:
+    """
+    Return the context cache holding preamble for this key/model, creating it on first use.
+    Returns None when caching is unavailable; callers then send the preamble inline.
+    """
+    cache_key = (api_key, model_name, preamble)
+    task = PREAMBLE_CACHES.get(cache_key)
+    if task is None:
+        task = asyncio.ensure_future(
+            create_preamble_cache(client, model_name, preamble, timeout)
+        )
+        PREAMBLE_CACHES[cache_key] = task
+    return await asyncio.shield(task)
+
+
+async def delete_preamble_caches(timeout: float) -> None:
+    """Delete this run's context caches; one that can't be deleted in time just expires."""
+    for (api_key, _, _), task in list(PREAMBLE_CACHES.items()):
+        if not task.done() or task.cancelled() or task.exception() or not task.result():
+            continue
+        try:
+            await asyncio.wait_for(
+                build_client(api_key).aio.caches.delete(name=task.result()), timeout=timeout
+            )
+        except asyncio.TimeoutError:
+            log(f"Timed out deleting context cache {task.result()} after {timeout}s")
+        except Exception as exc:
+            log(f"Failed to delete context cache {task.result()}: {exc}")
+    PREAMBLE_CACHES.clear()
+
+
+def open_summary_cache(path: str) -> sqlite3.Connection | None:
+    """
+    Open the on-disk summary cache and evict stale rows.
+    Returns None when the cache can't be opened; the run then proceeds uncached.
     """
+    try:
+        conn = sqlite3.connect(path)
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS topic_summaries("
+            "key TEXT PRIMARY KEY, final_count INTEGER, summary TEXT, created_at INTEGER)"
+        )
+        with conn:
+            # Left behind by earlier versions (prompt-hash, message-count and chunk keys)
+            conn.execute("DROP TABLE IF EXISTS prompt_summaries")
+            conn.execute("DROP TABLE IF EXISTS summaries")
+            conn.execute("DROP TABLE IF EXISTS chunk_summaries")
+            conn.execute(
+                "DELETE FROM topic_summaries WHERE created_at < ?",
+                (int(time.time()) - SUMMARY_CACHE_MAX_AGE_SECONDS,),
+            )
+            conn.execute(
+                "DELETE FROM topic_summaries WHERE rowid NOT IN "
+                "(SELECT rowid FROM topic_summaries ORDER BY created_at DESC LIMIT ?)",
+                (SUMMARY_CACHE_MAX_ROWS,),
+            )
+    except sqlite3.Error as exc:
+        print(f"Summary cache unavailable at {path}: {exc}")
+        return None
+    return conn
+
+
+def topic_cache_key(
+    group_id: int, topic_id: int, window_start: int, messages: list[ChatMessage]
+) -> str:
+    # Keyed on the exact message set: a sliding window that holds the same
+    # number of different messages must not reuse an older summary
+    payload = f"{group_id}:{topic_id}:{window_start}:" + "|".join(str(m.id) for m in messages)
+    return hashlib.sha256(payload.encode()).hexdigest()
+
+
+def get_cached_summary(conn: sqlite3.Connection | None, key: str) -> tuple[str, int] | None:
+    """
+    Look up a summary an earlier run produced for the same topic messages.
+    Returns: (summary, final_count) or None
+    """
+    if conn is None:
+        return None
+    try:
+        row = conn.execute(
+            "SELECT summary, final_count FROM topic_summaries WHERE key = ?", (key,)
+        ).fetchone()
+    except sqlite3.Error as exc:
+        log(f"Summary cache read failed: {exc}")
+        return None
+    return (row[0], row[1]) if row else None
+
 
+def store_cached_summary(
+    conn: sqlite3.Connection | None, key: str, final_count: int, summary: str
+) -> None:
+    if conn is None:
+        return
     try:
-        response = client.models.generate_content(
+        with conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO topic_summaries VALUES (?, ?, ?, ?)",
+                (key, final_count, summary, int(time.time())),
+            )
+    except sqlite3.Error as exc:
+        log(f"Summary cache write failed: {exc}")
+
+
+async def get_ai_summary(
+    client: genai.Client,
+    topic_name: str,
+    text_data: str,
+    timeframe_label: str,
+    model_name: str,
+    cache_name: str | None = None,
+) -> tuple[str, str | None]:
+    prompt = build_topic_prompt(topic_name, text_data)
+    if not cache_name:
+        prompt = build_summary_preamble(timeframe_label) + prompt
+
+    try:
+        response = await client.aio.models.generate_content(
             model=model_name,
             contents=prompt,
-            config=genai_types.GenerateContentConfig(
-                system_instruction=SYSTEM_INSTRUCTION,
-                safety_settings=SAFETY_SETTINGS,
-                temperature=0.3,
-            ),
+            config=build_generate_config(cache_name),
+        )
+    except Exception as exc:
+        return "", f"api_error: {exc}"
+
+    return extract_response_text(response)
+
+
+async def get_ai_summaries_batch(
+    client: genai.Client,
+    items: list[tuple[str, str]],
+    timeframe_label: str,
+    model_name: str,
+    cache_name: str | None = None,
+) -> tuple[dict[int, str], str | None]:
+    """Summarize several topics in one call. Returns ({item_index: summary}, feedback)."""
+    prompt = build_batch_topic_prompt(items)
+    if not cache_name:
+        prompt = build_summary_preamble(timeframe_label) + prompt
+
+    try:
+        response = await client.aio.models.generate_content(
+            model=model_name,
+            contents=prompt,
+            config=build_generate_config(cache_name, response_mime_type="application/json"),
+        )
+    except Exception as exc:
+        return {}, f"api_error: {exc}"
+
+    text, feedback = extract_response_text(response)
+    if not text:
+        return {}, feedback
+
+    try:
+        payload = json.loads(text)
+    except ValueError as exc:
+        return {}, f"batch_parse_error: {exc}"
+    if not isinstance(payload, dict):
+        return {}, "batch_parse_error: expected a JSON object"
+
+    summaries: dict[int, str] = {}
+    for key, value in payload.items():
+        if not str(key).strip().isdigit() or not isinstance(value, str):
+            continue
+        index = int(str(key).strip())
+        if 0 <= index < len(items) and value.strip():
+            summaries[index] = value.strip()
+    return summaries, None
+
+
+async def get_ai_summary_stream(
+    client: genai.Client,
+    topic_name: str,
+    text_data: str,
+    timeframe_label: str,
+    model_name: str,
+    cache_name: str | None,
+    on_partial,
+) -> tuple[str, str | None]:
+    """Like get_ai_summary, but streams the response and calls on_partial(text_so_far)."""
+    prompt = build_topic_prompt(topic_name, text_data)
+    if not cache_name:
+        prompt = build_summary_preamble(timeframe_label) + prompt
+
+    parts: list[str] = []
+    last_chunk = None
+    try:
+        stream = await client.aio.models.generate_content_stream(
+            model=model_name,
+            contents=prompt,
+            config=build_generate_config(cache_name),
         )
+        async for chunk in stream:
+            last_chunk = chunk
+            pf = getattr(chunk, "prompt_feedback", None)
+            if pf and getattr(pf, "block_reason", None):
+                return "", f"prompt_blocked: {pf.block_reason}"
+            if chunk.text:
+                parts.append(chunk.text)
+                on_partial("".join(parts))
     except Exception as exc:
         return "", f"api_error: {exc}"
 
+    summary = "".join(parts).strip()
+    if summary:
+        return summary, None
+    if last_chunk is None:
+        return "", "no_candidates"
+    return extract_response_text(last_chunk)
+
+
+def extract_response_text(response) -> tuple[str, str | None]:
     feedback = None
 
     # Check for blocked prompt
@@ -445,8 +970,8 @@ def get_ai_summary(
     # Try to get text from content parts
     content = getattr(cand, "content", None)
     if content:
-        parts = getattr(content, "parts", None) or []
-        text_parts = [getattr(p, "text", "") for p in parts if getattr(p, "text", "")]
+        parts = getattr(content, "parts", None) or ()
+        text_parts = [text for p in parts if (text := getattr(p, "text", None))]
         summary_text = "\n".join(text_parts).strip()
         if summary_text:
             return summary_text, None
@@ -456,14 +981,119 @@ def get_ai_summary(
     return "", feedback
 
 
-def run_summary(
-    client: genai.Client, topic_title: str, text_data: str, timeframe_label: str, model_name: str
+async def run_summary(
+    client: genai.Client,
+    topic_title: str,
+    text_data: str,
+    timeframe_label: str,
+    model_name: str,
+    cache_name: str | None = None,
 ) -> tuple[str, str | None]:
-    return get_ai_summary(client, topic_title, text_data, timeframe_label, model_name)
+    return await get_ai_summary(
+        client, topic_title, text_data, timeframe_label, model_name, cache_name
+    )
 
 
 def build_client(api_key: str) -> genai.Client:
-    return genai.Client(api_key=api_key)
+    # One client (and HTTP connection pool) per key for the whole run
+    client = GEMINI_CLIENTS.get(api_key)
+    if client is None:
+        client = GEMINI_CLIENTS[api_key] = genai.Client(api_key=api_key)
+    return client
+
+
+@contextlib.contextmanager
+def lease_api_key(api_keys: list[str], start_index: int):
+    """
+    Pick the key with the fewest Gemini calls in flight or waiting for a slot,
+    scanning in rotation order from start_index, and count it as busy until
+    the block exits.
+    Returns: (key_index, api_key)
+    """
+    key_idx = min(
+        range(start_index, start_index + len(api_keys)),
+        key=lambda i: KEYS_IN_FLIGHT.get(api_keys[i % len(api_keys)], 0),
+    )
+    api_key = api_keys[key_idx % len(api_keys)]
+    KEYS_IN_FLIGHT[api_key] = KEYS_IN_FLIGHT.get(api_key, 0) + 1
+    try:
+        yield key_idx, api_key
+    finally:
+        KEYS_IN_FLIGHT[api_key] -= 1
+
+
+class RateLimiter:
+    """
+    Token bucket pacing Gemini calls for one key/model (quotas are per model).
+    Holds up to a minute's worth of tokens, so short bursts go out at once.
+    A 429 halves the rate, which then climbs back to the configured rate over
+    RATE_LIMIT_RECOVERY_SECONDS.
+    """
+
+    def __init__(self, rate_per_minute: int) -> None:
+        self.max_rate = rate_per_minute / 60.0
+        self.rate = self.max_rate
+        self.capacity = float(rate_per_minute)
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self.resume_at = 0.0  # Retry-After from the server holds every call until then
+        self.lock = asyncio.Lock()
+
+    def refill(self, now: float) -> None:
+        elapsed = max(0.0, now - self.updated)
+        self.rate = min(
+            self.max_rate, self.rate + elapsed * self.max_rate / RATE_LIMIT_RECOVERY_SECONDS
+        )
+        self.tokens = min(self.capacity, self.tokens + elapsed * self.rate)
+        self.updated = max(self.updated, now)
+
+    async def acquire(self) -> None:
+        async with self.lock:
+            while True:
+                now = time.monotonic()
+                if now < self.resume_at:
+                    await asyncio.sleep(self.resume_at - now)
+                    continue
+                self.refill(now)
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                await asyncio.sleep((1 - self.tokens) / self.rate)
+
+    def backoff(self, retry_after: float | None = None) -> None:
+        """Called after a 429: empty the bucket, halve the rate and honour retry_after."""
+        now = time.monotonic()
+        self.refill(now)
+        self.rate = max(self.max_rate * RATE_LIMIT_MIN_FRACTION, self.rate / 2)
+        self.tokens = 0.0
+        if retry_after:
+            self.resume_at = max(self.resume_at, now + retry_after)
+            # Nothing refills while the server asked us to wait
+            self.updated = self.resume_at
+
+
+def get_rate_limiter(api_key: str, model_name: str, rate_per_minute: int) -> RateLimiter | None:
+    if rate_per_minute <= 0:
+        return None
+    limiter = RATE_LIMITERS.get((api_key, model_name))
+    if limiter is None:
+        limiter = RATE_LIMITERS[(api_key, model_name)] = RateLimiter(rate_per_minute)
+    return limiter
+
+
+def is_rate_limited_error(feedback: str | None) -> bool:
+    if not feedback:
+        return False
+    normalized = feedback.upper()
+    return "429" in normalized or "RESOURCE_EXHAUSTED" in normalized
+
+
+def parse_retry_delay(feedback: str | None) -> float | None:
+    """Seconds the server asked to wait, from a 429's RetryInfo ("retryDelay": "33s")."""
+    if not feedback:
+        return None
+    match = RETRY_DELAY_RE.search(feedback)
+    return float(match.group(1)) if match else None
 
 
 def is_model_overloaded_error(feedback: str | None) -> bool:
@@ -477,17 +1107,21 @@ def is_model_overloaded_error(feedback: str | None) -> bool:
     )
 
 
-async def send_summary(
-    client: TelegramClient, target, topic: types.ForumTopic, summary: str, message_count: int, test_mode: bool
-) -> None:
+def build_summary_payload(topic: types.ForumTopic, summary: str, message_count: int) -> str:
     header = f"[Summary] Topic: {topic.title} ({message_count} messages)"
     disclaimer = "⚠️ AI有幻觉，总结只作参考"
-    payload = f"{header}\n{disclaimer}\n\n{summary}"
-    
+    return f"{header}\n{disclaimer}\n\n{summary}"
+
+
+async def send_summary(
+    client: TelegramClient, peer, topic: types.ForumTopic, summary: str, message_count: int, test_mode: bool
+) -> None:
+    payload = build_summary_payload(topic, summary, message_count)
+
     # Debug logging
     print(f"  [DEBUG] send_summary called:")
     print(f"    - test_mode: {test_mode}")
-    print(f"    - target: {target} (type: {type(target).__name__})")
+    print(f"    - peer: {peer} (type: {type(peer).__name__})")
     print(f"    - topic.id: {topic.id}, topic.top_message: {topic.top_message}")
     print(f"    - payload length: {len(payload)} chars")
     
@@ -495,10 +1129,105 @@ async def send_summary(
         result = await client.send_message("me", payload)
         print(f"    - Sent to Saved Messages, msg_id: {result.id}")
     else:
-        result = await client.send_message(target, payload, reply_to=topic.top_message)
+        result = await client.send_message(peer, payload, reply_to=topic.top_message)
         print(f"    - Sent to topic, msg_id: {result.id}")
 
 
+class StreamedSummary:
+    """
+    Posts a summary while Gemini is still generating it, editing the message
+    as text arrives (at most every STREAM_EDIT_INTERVAL_SECONDS).
+    Edits run in a background task where the newest text wins, so a slow
+    Telegram edit (e.g. a flood wait) never stalls the timed Gemini call.
+    Any Telegram error disables streaming for the topic; the regular sender
+    then delivers the finished summary instead.
+    """
+
+    def __init__(
+        self, client: TelegramClient, peer, topic: types.ForumTopic, message_count: int, test_mode: bool
+    ) -> None:
+        self.client = client
+        self.peer = "me" if test_mode else peer
+        self.reply_to = None if test_mode else topic.top_message
+        self.topic = topic
+        self.message_count = message_count
+        self.message = None
+        self.failed = False
+        self.last_edit = 0.0
+        self.pending: str | None = None  # Newest text not yet posted
+        self.task: asyncio.Task | None = None
+        self.in_flight = False  # A send/edit is awaiting Telegram
+
+    def update(self, partial: str) -> None:
+        """Stage the text so far; returns immediately."""
+        if self.failed:
+            return
+        self.pending = partial
+        if self.task is None or self.task.done():
+            self.task = asyncio.ensure_future(self._flush())
+
+    async def _flush(self) -> None:
+        # Checked before the interval sleep too, so settle() never waits out a pause
+        while not self.failed and self.pending is not None:
+            if self.message is not None:
+                wait = self.last_edit + STREAM_EDIT_INTERVAL_SECONDS - time.monotonic()
+                if wait > 0:
+                    await asyncio.sleep(wait)
+            partial, self.pending = self.pending, None
+            if partial is None:
+                return
+
+            payload = build_summary_payload(self.topic, f"{partial.rstrip()} ▌", self.message_count)
+            self.in_flight = True
+            try:
+                if self.message is None:
+                    self.message = await self.client.send_message(
+                        self.peer, payload, reply_to=self.reply_to
+                    )
+                else:
+                    await self.client.edit_message(self.peer, self.message, payload)
+            except Exception as exc:
+                log(f"Streaming disabled for topic '{self.topic.title}': {exc}")
+                self.failed = True
+            finally:
+                self.in_flight = False
+            self.last_edit = time.monotonic()
+
+    async def settle(self) -> None:
+        """Drop staged text; an edit already sent to Telegram is allowed to finish."""
+        self.pending = None
+        task, self.task = self.task, None
+        if task is None:
+            return
+        if not self.in_flight:
+            task.cancel()
+        await asyncio.wait([task])
+
+    async def finish(self, summary: str, message_count: int) -> bool:
+        """Replace the partial text with the final summary. Returns True if delivered."""
+        await self.settle()
+        if self.message is None or self.failed:
+            await self.abort()
+            return False
+        payload = build_summary_payload(self.topic, summary, message_count)
+        try:
+            await self.client.edit_message(self.peer, self.message, payload)
+        except Exception as exc:
+            log(f"Final edit failed for topic '{self.topic.title}': {exc}")
+            await self.abort()
+            return False
+        return True
+
+    async def abort(self) -> None:
+        """Remove a partially streamed message so it is not left half-written."""
+        await self.settle()
+        if self.message is None:
+            return
+        try:
+            await self.client.delete_messages(self.peer, [self.message.id])
+        except Exception as exc:
+            log(f"Failed to delete partial summary for topic '{self.topic.title}': {exc}")
+        self.message = None
 
 
 async def run_summary_with_retry(
@@ -509,9 +1238,13 @@ async def run_summary_with_retry(
     timeframe_label: str,
     max_retries: int = 3,
     model_call_timeout_seconds: int = DEFAULT_MODEL_CALL_TIMEOUT_SECONDS,
+    gemini_sem: asyncio.Semaphore | None = None,
+    on_partial=None,
+    gemini_rpm: int = 0,
 ) -> tuple[str, str | None, int]:
     """
     Attempts to generate a summary using multiple models and rotating keys.
+    If on_partial is given, responses are streamed and it receives the text so far.
     Returns: (summary, feedback, next_key_index)
     """
     last_feedback = None
@@ -521,27 +1254,54 @@ async def run_summary_with_retry(
         print(f"  > [Model: {model_name}] Starting attempts...")
 
         for attempt in range(max_retries):
-            # Rotate key potentially on every attempt if previous failed
-            api_key = api_keys[current_key_idx % len(api_keys)]
-            client = build_client(api_key)
-            
-            # Mask key for logging
-            masked_key = f"...{api_key[-4:]}" if len(api_key) > 4 else "std"
-            print(f"    - Attempt {attempt + 1}/{max_retries} using key {masked_key}")
-            attempt_started = time.monotonic()
-
             try:
-                summary, feedback = await asyncio.wait_for(
-                    asyncio.to_thread(
-                        run_summary,
-                        client,
-                        topic_title,
-                        text_data,
-                        timeframe_label,
-                        model_name,
-                    ),
-                    timeout=model_call_timeout_seconds,
-                )
+                # Rotation order decides between equally busy keys; an idle key wins
+                with lease_api_key(api_keys, current_key_idx) as (current_key_idx, api_key):
+                    client = build_client(api_key)
+
+                    # Mask key for logging
+                    masked_key = f"...{api_key[-4:]}" if len(api_key) > 4 else "std"
+                    print(f"    - Attempt {attempt + 1}/{max_retries} using key {masked_key}")
+                    # Paced before taking a Gemini slot, so a throttled key doesn't
+                    # hold one while calls on other keys wait
+                    limiter = get_rate_limiter(api_key, model_name, gemini_rpm)
+                    if limiter:
+                        await limiter.acquire()
+
+                    async with gemini_sem or contextlib.nullcontext():
+                        attempt_started = time.monotonic()
+
+                        cache_name = await get_preamble_cache(
+                            client,
+                            api_key,
+                            model_name,
+                            build_summary_preamble(timeframe_label),
+                            model_call_timeout_seconds,
+                        )
+                        if on_partial:
+                            call = get_ai_summary_stream(
+                                client,
+                                topic_title,
+                                text_data,
+                                timeframe_label,
+                                model_name,
+                                cache_name,
+                                on_partial,
+                            )
+                        else:
+                            call = run_summary(
+                                client,
+                                topic_title,
+                                text_data,
+                                timeframe_label,
+                                model_name,
+                                cache_name,
+                            )
+                        summary, feedback = await asyncio.wait_for(
+                            call, timeout=model_call_timeout_seconds
+                        )
+                    if limiter and is_rate_limited_error(feedback):
+                        limiter.backoff(parse_retry_delay(feedback))
                 log(
                     f"Gemini call finished model={model_name} "
                     f"attempt={attempt + 1}/{max_retries} "
@@ -610,6 +1370,96 @@ async def run_summary_with_retry(
     return None, f"all_models_failed: {last_feedback}", current_key_idx
 
 
+async def run_batch_summary_with_retry(
+    api_keys: list[str],
+    start_key_index: int,
+    items: list[tuple[str, str]],
+    timeframe_label: str,
+    model_call_timeout_seconds: int = DEFAULT_MODEL_CALL_TIMEOUT_SECONDS,
+    gemini_sem: asyncio.Semaphore | None = None,
+    gemini_rpm: int = 0,
+) -> tuple[dict[int, str], str | None, int]:
+    """
+    Attempts one batched summary per model, rotating keys between models.
+    Topics missing from the result fall back to the per-topic path, so there
+    are no retries within a model.
+    Returns: (summaries, feedback, next_key_index)
+    """
+    last_feedback = None
+    current_key_idx = start_key_index
+    timeout = model_call_timeout_seconds * BATCH_TIMEOUT_FACTOR
+    input_chars = sum(len(text) for _, text in items)
+
+    for model_name in MODELS_TO_TRY[:BATCH_MODEL_ATTEMPTS]:
+        print(f"  > [Batch: {model_name}] Summarizing {len(items)} topics in one call...")
+        attempt_started = time.monotonic()
+
+        try:
+            with lease_api_key(api_keys, current_key_idx) as (current_key_idx, api_key):
+                client = build_client(api_key)
+                limiter = get_rate_limiter(api_key, model_name, gemini_rpm)
+                if limiter:
+                    await limiter.acquire()
+                async with gemini_sem or contextlib.nullcontext():
+                    cache_name = await get_preamble_cache(
+                        client,
+                        api_key,
+                        model_name,
+                        build_summary_preamble(timeframe_label),
+                        model_call_timeout_seconds,
+                    )
+                    summaries, feedback = await asyncio.wait_for(
+                        get_ai_summaries_batch(
+                            client, items, timeframe_label, model_name, cache_name
+                        ),
+                        timeout=timeout,
+                    )
+                if limiter and is_rate_limited_error(feedback):
+                    limiter.backoff(parse_retry_delay(feedback))
+        except asyncio.TimeoutError:
+            summaries, feedback = {}, f"model_timeout_after_{timeout}s"
+        except Exception as exc:
+            summaries, feedback = {}, f"exception: {exc}"
+        current_key_idx += 1
+
+        log(
+            f"Gemini batch call finished model={model_name} "
+            f"topics={len(summaries)}/{len(items)} "
+            f"elapsed={time.monotonic() - attempt_started:.2f}s "
+            f"input_chars={input_chars}"
+        )
+        if summaries:
+            return summaries, None, current_key_idx
+
+        last_feedback = feedback
+        update_runtime_state(last_feedback=str(feedback or ""))
+        print(f"    - Batch failed: {feedback}")
+
+        # A blocked batch will be retried topic by topic instead
+        if feedback and "prompt_blocked" in feedback:
+            break
+
+    return {}, f"batch_failed: {last_feedback}", current_key_idx
+
+
+def group_batches(items: list[tuple[str, str]]) -> list[list[int]]:
+    """Group item indexes into batches bounded by BATCH_MAX_TOPICS and BATCH_MAX_CHARS."""
+    batches: list[list[int]] = []
+    current: list[int] = []
+    current_chars = 0
+    for index, (_, text) in enumerate(items):
+        if current and (
+            len(current) >= BATCH_MAX_TOPICS or current_chars + len(text) > BATCH_MAX_CHARS
+        ):
+            batches.append(current)
+            current, current_chars = [], 0
+        current.append(index)
+        current_chars += len(text)
+    if current:
+        batches.append(current)
+    return batches
+
+
 async def run() -> None:
     if load_dotenv:
         load_dotenv()
@@ -635,28 +1485,44 @@ async def run() -> None:
     )
     if model_call_timeout_seconds < 5:
         model_call_timeout_seconds = 5
+    gemini_concurrency = max(
+        1, int(os.getenv("GEMINI_CONCURRENCY", str(DEFAULT_GEMINI_CONCURRENCY)))
+    )
+    gemini_rpm = max(0, int(os.getenv("GEMINI_RPM", str(DEFAULT_GEMINI_RPM))))
+    topic_concurrency = max(
+        1, int(os.getenv("TOPIC_CONCURRENCY", str(DEFAULT_TOPIC_CONCURRENCY)))
+    )
     target_group = parse_target_group(require_env("TARGET_GROUP"))
     test_mode = parse_bool(os.getenv("TEST_MODE"), default=True)
+    stream_summaries = parse_bool(os.getenv("STREAM_SUMMARIES"), default=False)
+    summary_cache_path = os.getenv("SUMMARY_CACHE_PATH", DEFAULT_SUMMARY_CACHE_PATH)
 
     # Debug: Show parsed config
     print(f"[DEBUG] Configuration:")
     print(f"  - TARGET_GROUP: {target_group}")
     print(f"  - TEST_MODE: {test_mode} (raw env: '{os.getenv('TEST_MODE')}')")
+    print(f"  - STREAM_SUMMARIES: {stream_summaries}")
     print(f"  - Available Keys: {len(gemini_api_keys)}")
     print(f"  - MODEL_CALL_TIMEOUT_SECONDS: {model_call_timeout_seconds}")
+    print(f"  - GEMINI_CONCURRENCY: {gemini_concurrency}")
+    print(f"  - GEMINI_RPM: {gemini_rpm or '(unlimited)'}")
+    print(f"  - TOPIC_CONCURRENCY: {topic_concurrency}")
+    print(f"  - SUMMARY_CACHE_PATH: {summary_cache_path or '(disabled)'}")
 
     topic_filter = os.getenv("TOPIC_FILTER")
-    ignored_topics = [
+    ignored_topics = frozenset(
         t.strip() for t in (os.getenv("IGNORED_TOPICS") or "").split(",") if t.strip()
-    ]
+    )
     if ignored_topics:
-        print(f"Ignored topics: {ignored_topics}")
+        print(f"Ignored topics: {sorted(ignored_topics)}")
 
     cutoff_utc = get_cutoff_time()
     timeframe_label = (
         f"{cutoff_utc.astimezone(HK_TZ).strftime('%m/%d %H:%M')} - "
-        f"{datetime.now(tz=pytz.UTC).astimezone(HK_TZ).strftime('%m/%d %H:%M')} (Asia/Hong_Kong)"
+        f"{datetime.now(tz=timezone.utc).astimezone(HK_TZ).strftime('%m/%d %H:%M')} (Asia/Hong_Kong)"
     )
+    # Re-runs over the same window (e.g. after a failed job) land in the same hour bucket
+    window_start = int(cutoff_utc.timestamp() // 3600) * 3600
 
     update_runtime_state(phase="connect_telegram")
     async with TelegramClient(StringSession(session_string), api_id, api_hash) as client:
@@ -664,9 +1530,12 @@ async def run() -> None:
             raise RuntimeError("The provided session string is not authorized.")
 
         update_runtime_state(phase="fetch_topics")
+        tg_sem = asyncio.Semaphore(TELEGRAM_CONCURRENCY)
         target = await client.get_entity(target_group)
+        # Resolved once; every request and send below reuses the input peer
+        input_peer = await client.get_input_entity(target)
         topics_fetch_started = time.monotonic()
-        topics, total_topic_count = await fetch_topics(client, target)
+        topics, total_topic_count, last_activity = await fetch_topics(client, input_peer, tg_sem)
         log(
             f"Fetched topics count={len(topics)} total_count={total_topic_count} "
             f"elapsed={time.monotonic() - topics_fetch_started:.2f}s"
@@ -691,90 +1560,168 @@ async def run() -> None:
         topics_no_activity: list[str] = []
         topics_no_summary: list[str] = []
 
+        # Sender labels are shared by every topic in the group
+        entity_cache: dict[int, str] = {}
+        # Which topic reference (top_message or id) searches succeed with
+        reference_hits: dict[str, int] = {}
+
         # Track key usage to balance load across topics
         current_key_usage_idx = 0
+        topic_sem = asyncio.Semaphore(topic_concurrency)
+        gemini_sem = asyncio.Semaphore(gemini_concurrency)
+        summary_cache = open_summary_cache(summary_cache_path) if summary_cache_path else None
+
+        async def fetch_topic(idx: int, topic: types.ForumTopic) -> tuple[list[ChatMessage], bool]:
+            async with topic_sem:
+                update_runtime_state(
+                    phase="fetch_messages",
+                    topic=topic.title or "",
+                    topic_index=idx + 1,
+                    topics_total=len(topics),
+                )
 
-        for idx, topic in enumerate(topics):
-            update_runtime_state(
-                phase="topic_loop",
-                topic=topic.title or "",
-                topic_index=idx + 1,
-                topics_total=len(topics),
-            )
-            if topic.title in ignored_topics:
-                print(f"Skipping ignored topic: {topic.title}")
-                continue
-            if not can_speak_in_topic(topic):
-                print(f"Skipping closed topic (no speaking permission): {topic.title}")
-                continue
-
-            topic_started = time.monotonic()
-            messages, truncated = await fetch_messages_for_topic(
-                client, target, topic, cutoff_utc
-            )
-            log(
-                f"Topic fetch done topic='{topic.title}' messages={len(messages)} "
-                f"elapsed={time.monotonic() - topic_started:.2f}s"
+                topic_started = time.monotonic()
+                messages, truncated = await fetch_messages_for_topic(
+                    client, input_peer, topic, cutoff_utc, entity_cache, tg_sem, reference_hits
+                )
+                log(
+                    f"Topic fetch done topic='{topic.title}' messages={len(messages)} "
+                    f"elapsed={time.monotonic() - topic_started:.2f}s"
+                )
+                if messages:
+                    print(f"Topic '{topic.title}': {len(messages)} messages in window")
+                return messages, truncated
+
+        async def summarize_chunk(
+            topic: types.ForumTopic,
+            chunk_num: int,
+            total_chunks: int,
+            chunk: list[ChatMessage],
+            start_key_idx: int,
+        ) -> tuple[str | None, int]:
+            """
+            Summarize one chunk of a large topic.
+            Returns: (chunk_summary, next_key_index)
+            """
+            print(f"  > Processing chunk {chunk_num}/{total_chunks} ({len(chunk)} messages)...")
+            chunk_text = format_messages(chunk, truncated=False, timeframe_label=timeframe_label)
+            chunk_summary, chunk_feedback, next_idx = await run_summary_with_retry(
+                gemini_api_keys,
+                start_key_idx,
+                topic.title,
+                chunk_text,
+                timeframe_label,
+                model_call_timeout_seconds=model_call_timeout_seconds,
+                gemini_sem=gemini_sem,
+                gemini_rpm=gemini_rpm,
             )
-            if not messages:
-                topics_no_activity.append(topic.title)
-                continue
-
-            print(f"Topic '{topic.title}': {len(messages)} messages in window")
+            if not chunk_summary:
+                print(f"  > Chunk {chunk_num}/{total_chunks} failed: {chunk_feedback}")
+            return chunk_summary, next_idx
+
+        async def reduce_partials(
+            topic: types.ForumTopic, partials: list[str], start_key_idx: int
+        ) -> tuple[list[str], int]:
+            """
+            Merge partial summaries in groups of REDUCE_FANOUT until one final
+            reduce prompt can take them all. A group that fails to merge is kept
+            as its joined text, so every level still shrinks the list.
+            Returns: (partials, next_key_index)
+            """
+            key_idx = start_key_idx
+            level = 1
+            while len(partials) > REDUCE_FANOUT:
+                groups = [
+                    partials[i : i + REDUCE_FANOUT] for i in range(0, len(partials), REDUCE_FANOUT)
+                ]
+                print(
+                    f"  > Reduce level {level}: merging {len(partials)} partial summaries "
+                    f"into {len(groups)}..."
+                )
+                results = await asyncio.gather(
+                    *(
+                        run_summary_with_retry(
+                            gemini_api_keys,
+                            key_idx + group_idx,
+                            topic.title,
+                            "\n\n".join(group),
+                            timeframe_label,
+                            model_call_timeout_seconds=model_call_timeout_seconds,
+                            gemini_sem=gemini_sem,
+                            gemini_rpm=gemini_rpm,
+                        )
+                        for group_idx, group in enumerate(groups)
+                        if len(group) > 1
+                    )
+                )
+                merged = iter(results)
+                next_partials = []
+                for group in groups:
+                    if len(group) == 1:
+                        next_partials.append(group[0])
+                        continue
+                    summary, _, next_idx = next(merged)
+                    next_partials.append(summary or "\n\n".join(group))
+                    key_idx = max(key_idx, next_idx)
+                partials = next_partials
+                level += 1
+            return partials, key_idx
+
+        async def process_topic(
+            topic: types.ForumTopic, messages: list[ChatMessage], truncated: bool
+        ) -> tuple[types.ForumTopic, str | None, str | None, int, bool]:
+            """
+            Summarize a single topic on its own.
+            Returns: (topic, summary, feedback, message_count, delivered)
+            delivered is True when the summary was already streamed into Telegram.
+            """
+            nonlocal current_key_usage_idx
+
+            update_runtime_state(topic=topic.title or "")
 
             summary = ""
             feedback = None
             retried = False
+            streamer = (
+                StreamedSummary(client, input_peer, topic, len(messages), test_mode)
+                if stream_summaries
+                else None
+            )
+            on_partial = streamer.update if streamer else None
 
-            # Use rotating index for starting key to distribute load
+            # Reserve a starting key so concurrent topics spread across keys
             start_key_idx = current_key_usage_idx
+            current_key_usage_idx += 1
 
-            if len(messages) > CHUNK_SIZE:
-                total_chunks = (len(messages) + CHUNK_SIZE - 1) // CHUNK_SIZE
+            chunks = split_into_chunks(messages)
+            if len(chunks) > 1:
+                total_chunks = len(chunks)
                 print(
-                    f"  > Large topic ({len(messages)} msgs). Splitting into {total_chunks} chunks of {CHUNK_SIZE}..."
+                    f"  > Large topic ({len(messages)} msgs). Splitting into {total_chunks} chunks of up to {CHUNK_MAX_CHARS} chars..."
                 )
-                partial_summaries = []
-
-                local_key_idx = start_key_idx
-
-                for i in range(0, len(messages), CHUNK_SIZE):
-                    chunk_num = i // CHUNK_SIZE + 1
-                    chunk = messages[i : i + CHUNK_SIZE]
-
-                    # Short delay between chunks (except for first)
-                    if i > 0:
-                        print(f"  > Waiting {CHUNK_DELAY_SECONDS}s...")
-                        await asyncio.sleep(CHUNK_DELAY_SECONDS)
-
-                    print(
-                        f"  > Processing chunk {chunk_num}/{total_chunks} ({len(chunk)} messages)..."
-                    )
-                    chunk_text = format_messages(
-                        chunk, truncated=False, timeframe_label=timeframe_label
-                    )
-
-                    chunk_summary, chunk_feedback, next_idx = await run_summary_with_retry(
-                        gemini_api_keys,
-                        local_key_idx,
-                        topic.title,
-                        chunk_text,
-                        timeframe_label,
-                        model_call_timeout_seconds=model_call_timeout_seconds,
+                # Chunks run concurrently; gemini_sem caps the calls in flight and
+                # each chunk starts from its own key so they spread across keys
+                chunk_results = await asyncio.gather(
+                    *(
+                        summarize_chunk(
+                            topic, chunk_num, total_chunks, chunk, start_key_idx + chunk_num - 1
+                        )
+                        for chunk_num, chunk in enumerate(chunks, start=1)
                     )
-                    local_key_idx = next_idx  # Update local index for next chunk
-
-                    if chunk_summary:
-                        partial_summaries.append(chunk_summary)
-                    else:
-                        print(f"  > Chunk {chunk_num}/{total_chunks} failed: {chunk_feedback}")
+                )
+                partial_summaries = [chunk_summary for chunk_summary, _ in chunk_results if chunk_summary]
+                local_key_idx = max(next_idx for _, next_idx in chunk_results)
 
                 if partial_summaries:
-                    print(f"  > Waiting {CHUNK_DELAY_SECONDS}s before final summary...")
-                    await asyncio.sleep(CHUNK_DELAY_SECONDS)
+                    # Repetitive chunks (bot noise) can come back identical
+                    partial_summaries = list(dict.fromkeys(partial_summaries))
+                    if len(partial_summaries) > REDUCE_FANOUT:
+                        partial_summaries, local_key_idx = await reduce_partials(
+                            topic, partial_summaries, local_key_idx
+                        )
                     print("  > Generating final summary from partial summaries...")
                     combined_text = "\n\n".join(partial_summaries)
-                    
+
                     # Pass the latest key index to continue rotation
                     summary, feedback, next_idx = await run_summary_with_retry(
                         gemini_api_keys,
@@ -783,9 +1730,12 @@ async def run() -> None:
                         combined_text,
                         timeframe_label,
                         model_call_timeout_seconds=model_call_timeout_seconds,
+                        gemini_sem=gemini_sem,
+                        gemini_rpm=gemini_rpm,
+                        on_partial=on_partial,
                     )
                     # Update global index for next topic
-                    current_key_usage_idx = next_idx
+                    current_key_usage_idx = max(current_key_usage_idx, next_idx)
                 else:
                     print("  > No partial summaries generated.")
             else:
@@ -798,21 +1748,21 @@ async def run() -> None:
                     text_data,
                     timeframe_label,
                     model_call_timeout_seconds=model_call_timeout_seconds,
+                    gemini_sem=gemini_sem,
+                    gemini_rpm=gemini_rpm,
+                    on_partial=on_partial,
                 )
-                current_key_usage_idx = next_idx
+                current_key_usage_idx = max(current_key_usage_idx, next_idx)
+
+            if not summary and streamer:
+                await streamer.abort()
+                streamer = None
 
             if not summary:
-                retried = False
-                should_retry = (feedback and "prompt_blocked" in feedback) or (
-                    feedback and "exception" in feedback
-                )
-                # Note: With new fail-fast logic, blocked prompts shouldn't be retried blindly,
-                # but we keep this fallback specifically for "exception" or if we want to try truncation.
-                # If it was blocked, our new logic breaks early, so maybe we shouldn't retry?
-                # Let's keep the fallback for robust truncation only if it WASN'T a hard block.
-                
+                # Keep the truncation fallback only if the prompt WASN'T a hard block;
+                # blocked prompts already fail fast inside run_summary_with_retry.
                 is_hard_block = feedback and "prompt_blocked" in feedback
-                
+
                 if (not is_hard_block) and len(messages) > FALLBACK_MESSAGES:
                     fallback_msgs = messages[-FALLBACK_MESSAGES:]
                     fallback_text = format_messages(
@@ -828,16 +1778,17 @@ async def run() -> None:
                         fallback_text,
                         timeframe_label,
                         model_call_timeout_seconds=model_call_timeout_seconds,
+                        gemini_sem=gemini_sem,
+                        gemini_rpm=gemini_rpm,
                     )
-                    current_key_usage_idx = next_idx
+                    current_key_usage_idx = max(current_key_usage_idx, next_idx)
                     if summary:
                         retried = True
 
             if not summary:
                 reason = f"{feedback} (retried)" if retried else feedback
                 print(f"Gemini failed topic '{topic.title}'. Reason: {reason}")
-                topics_no_summary.append(topic.title)
-                continue
+                return topic, None, feedback, len(messages), False
 
             summary = summary.rstrip() + "\n\n#总结"
 
@@ -846,25 +1797,207 @@ async def run() -> None:
                 summary = f"(重试后生成，使用最后 {FALLBACK_MESSAGES} 条消息)\n\n{summary}"
                 final_count = min(len(messages), FALLBACK_MESSAGES)
 
+            store_cached_summary(
+                summary_cache,
+                topic_cache_key(target.id, topic.id, window_start, messages),
+                final_count,
+                summary,
+            )
+            delivered = bool(streamer) and await streamer.finish(summary, final_count)
+            return topic, summary, feedback, final_count, delivered
+
+        eligible: list[tuple[int, types.ForumTopic]] = []
+        for idx, topic in enumerate(topics):
+            if topic.title in ignored_topics:
+                print(f"Skipping ignored topic: {topic.title}")
+                continue
+            if not can_speak_in_topic(topic):
+                print(f"Skipping closed topic (no speaking permission): {topic.title}")
+                continue
+            # Nothing newer than the cutoff: no need to search the topic at all
+            last_active = last_activity.get(topic.id)
+            if last_active and last_active < cutoff_utc:
+                topics_no_activity.append(topic.title)
+                continue
+            eligible.append((idx, topic))
+
+        # Three-stage pipeline: fetch -> summarize -> send. Each stage hands work
+        # to the next through a bounded queue so Telegram fetches, Gemini calls and
+        # sends overlap instead of running back to back.
+        summarizer_count = gemini_concurrency
+        fetch_q: asyncio.Queue = asyncio.Queue(maxsize=PIPELINE_QUEUE_SIZE)
+        send_q: asyncio.Queue = asyncio.Queue(maxsize=PIPELINE_QUEUE_SIZE)
+        # Small topics waiting to share a batched call: (topic, messages, text_data)
+        deferred: list[tuple[types.ForumTopic, list[ChatMessage], str]] = []
+
+        async def fetcher() -> None:
+            async def fetch_one(idx: int, topic: types.ForumTopic) -> None:
+                try:
+                    messages, truncated = await fetch_topic(idx, topic)
+                except Exception as exc:
+                    await send_q.put((topic, exc))
+                    return
+                await fetch_q.put((topic, messages, truncated))
+
+            await asyncio.gather(*(fetch_one(idx, topic) for idx, topic in eligible))
+            for _ in range(summarizer_count):
+                await fetch_q.put(None)
+
+        async def summarize_single(
+            topic: types.ForumTopic, messages: list[ChatMessage], truncated: bool
+        ) -> None:
             try:
-                await send_summary(client, target, topic, summary, final_count, test_mode)
-                destination = "Saved Messages" if test_mode else f"Topic: {topic.title}"
-                print(f"Sent summary to {destination}")
-                summaries_sent += 1
-                update_runtime_state(summaries_sent=summaries_sent)
-            except (UserBannedInChannelError, ChatWriteForbiddenError) as exc:
-                print(
-                    f"Write restricted for topic '{topic.title}': {exc}. Sending to Saved Messages instead."
+                result = await process_topic(topic, messages, truncated)
+            except Exception as exc:
+                result = exc
+            await send_q.put((topic, result))
+
+        async def summarize_batch(batch: list[tuple[types.ForumTopic, list[ChatMessage], str]]) -> None:
+            nonlocal current_key_usage_idx
+
+            if len(batch) == 1:
+                topic, messages, _ = batch[0]
+                await summarize_single(topic, messages, False)
+                return
+
+            items = [(topic.title, text_data) for topic, _, text_data in batch]
+            for group in group_batches(items):
+                start_key_idx = current_key_usage_idx
+                current_key_usage_idx += BATCH_MODEL_ATTEMPTS
+                try:
+                    summaries, _, _ = await run_batch_summary_with_retry(
+                        gemini_api_keys,
+                        start_key_idx,
+                        [items[i] for i in group],
+                        timeframe_label,
+                        model_call_timeout_seconds=model_call_timeout_seconds,
+                        gemini_sem=gemini_sem,
+                        gemini_rpm=gemini_rpm,
+                    )
+                except Exception as exc:
+                    print(f"  > Batch summary failed: {exc}")
+                    summaries = {}
+
+                # Anything the batch missed goes through the per-topic path
+                for local_idx, item_idx in enumerate(group):
+                    topic, messages, _ = batch[item_idx]
+                    summary = summaries.get(local_idx)
+                    if not summary:
+                        await summarize_single(topic, messages, False)
+                        continue
+                    summary = summary.rstrip() + "\n\n#总结"
+                    store_cached_summary(
+                        summary_cache,
+                        topic_cache_key(target.id, topic.id, window_start, messages),
+                        len(messages),
+                        summary,
+                    )
+                    await send_q.put((topic, (topic, summary, None, len(messages), False)))
+
+        async def summarizer() -> None:
+            nonlocal deferred
+
+            while True:
+                item = await fetch_q.get()
+                if item is None:
+                    break
+                topic, messages, truncated = item
+                if not messages:
+                    await send_q.put((topic, (topic, None, None, 0, False)))
+                    continue
+                if (
+                    len(messages) < MIN_SUMMARY_MESSAGES
+                    and sum(len(m.text) for m in messages) < MIN_SUMMARY_CHARS
+                ):
+                    print(f"Skipping near-empty topic '{topic.title}' ({len(messages)} short messages)")
+                    await send_q.put((topic, (topic, None, None, 0, False)))
+                    continue
+                cached = get_cached_summary(
+                    summary_cache, topic_cache_key(target.id, topic.id, window_start, messages)
                 )
-                fallback_note = (
-                    f"[Summary not delivered] Topic: {topic.title}\n"
-                    f"Reason: {exc}\n\n{summary}"
+                if cached:
+                    print(f"Reusing cached summary for topic '{topic.title}'")
+                    summary, final_count = cached
+                    await send_q.put((topic, (topic, summary, None, final_count, False)))
+                    continue
+                # Chunked topics are formatted chunk by chunk later, so only
+                # estimate their size here instead of formatting them twice
+                if transcript_chars(messages) > CHUNK_MAX_CHARS:
+                    await summarize_single(topic, messages, truncated)
+                    continue
+
+                # Small topics share a Gemini call once enough have accumulated
+                deferred.append(
+                    (topic, messages, format_messages(messages, truncated, timeframe_label))
                 )
-                await client.send_message("me", fallback_note)
-                topics_no_summary.append(f"{topic.title} (write restricted)")
-            except Exception as exc:
-                print(f"Failed to send summary for topic '{topic.title}': {exc}")
-                topics_no_summary.append(topic.title)
+                deferred_chars = sum(len(text_data) for _, _, text_data in deferred)
+                if len(deferred) >= BATCH_MAX_TOPICS or deferred_chars >= BATCH_MAX_CHARS:
+                    batch, deferred = deferred, []
+                    await summarize_batch(batch)
+
+        async def summarize_stage() -> None:
+            nonlocal deferred
+
+            await asyncio.gather(*(summarizer() for _ in range(summarizer_count)))
+            if deferred:
+                batch, deferred = deferred, []
+                await summarize_batch(batch)
+            await send_q.put(None)
+
+        async def sender() -> None:
+            nonlocal summaries_sent
+
+            # Sends stay serialized to avoid Telegram flood-wait
+            while True:
+                item = await send_q.get()
+                if item is None:
+                    break
+                topic, result = item
+                if isinstance(result, BaseException):
+                    print(f"Failed to process topic '{topic.title}': {result}")
+                    topics_no_summary.append(topic.title)
+                    continue
+
+                _, summary, _, final_count, delivered = result
+                if final_count == 0:
+                    topics_no_activity.append(topic.title)
+                    continue
+                if not summary:
+                    topics_no_summary.append(topic.title)
+                    continue
+                if delivered:
+                    print(f"Streamed summary for topic '{topic.title}'")
+                    summaries_sent += 1
+                    update_runtime_state(summaries_sent=summaries_sent)
+                    continue
+
+                try:
+                    await send_summary(client, input_peer, topic, summary, final_count, test_mode)
+                    destination = "Saved Messages" if test_mode else f"Topic: {topic.title}"
+                    print(f"Sent summary to {destination}")
+                    summaries_sent += 1
+                    update_runtime_state(summaries_sent=summaries_sent)
+                except (UserBannedInChannelError, ChatWriteForbiddenError) as exc:
+                    print(
+                        f"Write restricted for topic '{topic.title}': {exc}. Sending to Saved Messages instead."
+                    )
+                    fallback_note = (
+                        f"[Summary not delivered] Topic: {topic.title}\n"
+                        f"Reason: {exc}\n\n{summary}"
+                    )
+                    await client.send_message("me", fallback_note)
+                    topics_no_summary.append(f"{topic.title} (write restricted)")
+                except Exception as exc:
+                    print(f"Failed to send summary for topic '{topic.title}': {exc}")
+                    topics_no_summary.append(topic.title)
+
+        update_runtime_state(phase="pipeline")
+        try:
+            await asyncio.gather(fetcher(), summarize_stage(), sender())
+        finally:
+            await delete_preamble_caches(model_call_timeout_seconds)
+            if summary_cache:
+                summary_cache.close()
 
         if summaries_sent == 0 and test_mode:
             notice_lines = [
@@ -884,8 +2017,10 @@ async def run() -> None:
 
 if __name__ == "__main__":
     install_signal_handlers()
+    # libuv-backed event loop when available; plain asyncio otherwise
+    runner = uvloop.run if uvloop else asyncio.run
     try:
-        asyncio.run(run())
+        runner(run())
     except BaseException:
         dump_runtime_diagnostics("abnormal_exit")
         raise
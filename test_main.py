@@ -0,0 +1,419 @@
+import asyncio
+import random
+import time
+import unittest
+from datetime import datetime, timedelta, timezone
+from types import SimpleNamespace
+from unittest import mock
+
+from telethon import functions, types
+
+import main
+
+BASE_TIME = datetime(2025, 1, 1, tzinfo=timezone.utc)
+
+
+def make_message(message_id: int, date: datetime, text: str = "hello") -> SimpleNamespace:
+    return SimpleNamespace(
+        id=message_id, date=date, message=text, from_id=types.PeerUser(user_id=1)
+    )
+
+
+class FakeSearchClient:
+    """
+    Answers messages.SearchRequest like Telegram does for one topic: newest
+    first, below offset_id, above min_id, not older than min_date, at most
+    limit per page. Any other top_msg_id gets an empty result.
+    """
+
+    def __init__(self, messages: list[SimpleNamespace], top_msg_id: int) -> None:
+        self.messages = sorted(messages, key=lambda m: m.id, reverse=True)
+        self.top_msg_id = top_msg_id
+        self.requests: list[functions.messages.SearchRequest] = []
+
+    async def __call__(self, request):
+        assert isinstance(request, functions.messages.SearchRequest)
+        assert request.min_id >= 0, f"negative min_id {request.min_id}"
+        self.requests.append(request)
+        await asyncio.sleep(0)
+        page = []
+        if request.top_msg_id == self.top_msg_id:
+            for m in self.messages:
+                if request.offset_id and m.id >= request.offset_id:
+                    continue
+                if m.id <= request.min_id or m.date.timestamp() < request.min_date:
+                    continue
+                page.append(m)
+                if len(page) >= request.limit:
+                    break
+        return SimpleNamespace(
+            messages=page, users=[SimpleNamespace(id=1, username="alice")], chats=[]
+        )
+
+
+def make_history(rng: random.Random, count: int) -> list[SimpleNamespace]:
+    """count messages with gaps in their ids, oldest first, at a random pace."""
+    messages = []
+    message_id = rng.randint(1, 50)
+    date = BASE_TIME
+    for _ in range(count):
+        messages.append(make_message(message_id, date))
+        message_id += rng.choice((1, 1, 1, 2, 5, 40))
+        date += timedelta(seconds=rng.choice((1, 5, 30, 120, 900)))
+    return messages
+
+
+def fetch(client: FakeSearchClient, topic, cutoff: datetime, reference_hits=None):
+    return asyncio.run(
+        main.fetch_messages_for_topic(
+            client, "peer", topic, cutoff, {}, asyncio.Semaphore(3), reference_hits
+        )
+    )
+
+
+class FetchMessagesForTopicTest(unittest.TestCase):
+    def test_returns_exactly_the_in_window_messages(self) -> None:
+        rng = random.Random(1234)
+        for trial in range(300):
+            history = make_history(rng, rng.randint(0, 1500))
+            if history:
+                cutoff = rng.choice(history).date - timedelta(seconds=rng.choice((0, 1)))
+            else:
+                cutoff = BASE_TIME
+            topic = SimpleNamespace(id=1, top_message=1)
+            client = FakeSearchClient(history, topic.top_message)
+
+            messages, truncated = fetch(client, topic, cutoff)
+
+            expected = [m.id for m in history if m.date >= cutoff]
+            with self.subTest(trial=trial, total=len(history), expected=len(expected)):
+                self.assertEqual([m.id for m in messages], expected)
+                self.assertFalse(truncated)
+
+    def test_small_group_ranges_stay_non_negative(self) -> None:
+        # Ids start near 1, so later range bounds would go below zero
+        history = [make_message(i, BASE_TIME + timedelta(seconds=i)) for i in range(1, 251)]
+        topic = SimpleNamespace(id=1, top_message=1)
+        client = FakeSearchClient(history, topic.top_message)
+
+        messages, _ = fetch(client, topic, BASE_TIME - timedelta(hours=1))
+
+        self.assertEqual([m.id for m in messages], list(range(1, 251)))
+        self.assertTrue(all(r.min_id >= 0 for r in client.requests))
+
+    def test_short_first_page_is_one_request(self) -> None:
+        history = [make_message(i, BASE_TIME + timedelta(seconds=i)) for i in range(1, 100)]
+        topic = SimpleNamespace(id=1, top_message=1)
+        client = FakeSearchClient(history, topic.top_message)
+
+        messages, _ = fetch(client, topic, BASE_TIME)
+
+        self.assertEqual(len(messages), 99)
+        self.assertEqual(len(client.requests), 1)
+
+    def test_ranges_end_without_empty_requests(self) -> None:
+        for count in (150, 450, 2000):
+            history = [
+                make_message(i, BASE_TIME + timedelta(seconds=10 * i)) for i in range(1, count + 1)
+            ]
+            topic = SimpleNamespace(id=1, top_message=1)
+            client = FakeSearchClient(history, topic.top_message)
+
+            messages, _ = fetch(client, topic, BASE_TIME)
+
+            with self.subTest(count=count):
+                self.assertEqual(len(messages), count)
+                # No more pages than serial pagination would need
+                self.assertLessEqual(len(client.requests), count // main.SEARCH_PAGE_SIZE + 1)
+
+    def test_skips_empty_and_summary_messages(self) -> None:
+        history = [
+            make_message(1, BASE_TIME, "first"),
+            make_message(2, BASE_TIME + timedelta(minutes=1), "   "),
+            make_message(3, BASE_TIME + timedelta(minutes=2), "[Summary] Topic: x"),
+            make_message(4, BASE_TIME + timedelta(minutes=3), "last #总结"),
+            make_message(5, BASE_TIME + timedelta(minutes=4), "kept"),
+        ]
+        topic = SimpleNamespace(id=1, top_message=1)
+        client = FakeSearchClient(history, topic.top_message)
+
+        messages, truncated = fetch(client, topic, BASE_TIME)
+
+        self.assertEqual(
+            [(m.id, m.sender, m.text) for m in messages],
+            [(1, "@alice", "first"), (5, "@alice", "kept")],
+        )
+        self.assertFalse(truncated)
+
+    def test_falls_back_to_topic_id_and_remembers_it(self) -> None:
+        history = [make_message(i, BASE_TIME + timedelta(seconds=i)) for i in range(10, 20)]
+        topic = SimpleNamespace(id=7, top_message=99)
+        client = FakeSearchClient(history, topic.id)
+        reference_hits: dict[str, int] = {}
+
+        messages, _ = fetch(client, topic, BASE_TIME, reference_hits)
+
+        self.assertEqual(len(messages), 10)
+        self.assertEqual(reference_hits, {"id": 1})
+
+        # The next topic tries the reference that worked first
+        client.requests.clear()
+        fetch(client, topic, BASE_TIME, reference_hits)
+        self.assertEqual(client.requests[0].top_msg_id, topic.id)
+
+    def test_cap_keeps_the_newest_messages(self) -> None:
+        rng = random.Random(99)
+        for trial in range(100):
+            cap = rng.choice((50, 150, 420))
+            history = make_history(rng, rng.randint(cap + 1, 1500))
+            cutoff = history[0].date
+            topic = SimpleNamespace(id=1, top_message=1)
+            client = FakeSearchClient(history, topic.top_message)
+
+            with mock.patch.object(main, "MAX_MESSAGES_PER_TOPIC", cap):
+                messages, truncated = fetch(client, topic, cutoff)
+
+            with self.subTest(trial=trial, total=len(history), cap=cap):
+                self.assertEqual([m.id for m in messages], [m.id for m in history[-cap:]])
+                self.assertTrue(truncated)
+
+    def test_cap_stops_paginating_early(self) -> None:
+        history = make_history(random.Random(5), 3000)
+        topic = SimpleNamespace(id=1, top_message=1)
+        full = FakeSearchClient(history, topic.top_message)
+        fetch(full, topic, history[0].date)
+        capped = FakeSearchClient(history, topic.top_message)
+
+        with mock.patch.object(main, "MAX_MESSAGES_PER_TOPIC", 300):
+            messages, _ = fetch(capped, topic, history[0].date)
+
+        self.assertEqual(len(messages), 300)
+        self.assertLess(len(capped.requests), len(full.requests))
+
+
+def chat_messages(texts: list[str]) -> list[main.ChatMessage]:
+    return [
+        main.ChatMessage(id=i, sender="@alice", text=text, time=BASE_TIME + timedelta(minutes=i))
+        for i, text in enumerate(texts)
+    ]
+
+
+class ChunkingTest(unittest.TestCase):
+    def test_transcript_chars_matches_formatted_length(self) -> None:
+        messages = chat_messages(["gm", "短消息", "x" * 500, "链接 https://example.com"])
+        header = len("时间范围：label")
+
+        formatted = main.format_messages(messages, truncated=False, timeframe_label="label")
+
+        self.assertEqual(main.transcript_chars(messages), len(formatted) - header)
+
+    def test_chunks_stay_under_the_limit_and_keep_order(self) -> None:
+        rng = random.Random(7)
+        messages = chat_messages(["字" * rng.randint(1, 400) for _ in range(600)])
+
+        with mock.patch.object(main, "CHUNK_MAX_CHARS", 5000):
+            chunks = main.split_into_chunks(messages)
+
+        self.assertGreater(len(chunks), 1)
+        self.assertEqual([m for chunk in chunks for m in chunk], messages)
+        for chunk in chunks:
+            self.assertLessEqual(main.transcript_chars(chunk), 5000)
+        # Greedy packing: the next message would not have fit
+        for chunk, following in zip(chunks, chunks[1:]):
+            self.assertGreater(main.transcript_chars(chunk + following[:1]), 5000)
+
+    def test_oversized_message_gets_its_own_chunk(self) -> None:
+        messages = chat_messages(["a", "b" * 200, "c"])
+
+        with mock.patch.object(main, "CHUNK_MAX_CHARS", 100):
+            chunks = main.split_into_chunks(messages)
+
+        self.assertEqual([[m.text[0] for m in chunk] for chunk in chunks], [["a"], ["b"], ["c"]])
+
+    def test_small_topic_is_one_chunk(self) -> None:
+        messages = chat_messages(["gm"] * 1000)
+
+        self.assertEqual(main.split_into_chunks(messages), [messages])
+        self.assertEqual(main.split_into_chunks([]), [])
+
+
+class FakeGeminiClient:
+    """Returns a canned response text from aio.models.generate_content."""
+
+    def __init__(self, text: str) -> None:
+        self.calls: list[dict] = []
+
+        async def generate_content(**kwargs):
+            self.calls.append(kwargs)
+            return SimpleNamespace(prompt_feedback=None, text=text, candidates=[])
+
+        self.aio = SimpleNamespace(models=SimpleNamespace(generate_content=generate_content))
+
+
+def summarize_batch(text: str, items: list[tuple[str, str]]):
+    client = FakeGeminiClient(text)
+    return asyncio.run(
+        main.get_ai_summaries_batch(client, items, "label", "model", cache_name="cache")
+    )
+
+
+class BatchTest(unittest.TestCase):
+    def test_group_batches_respects_both_bounds(self) -> None:
+        items = [(f"t{i}", "x" * size) for i, size in enumerate([10] * 25 + [150, 150, 10])]
+
+        with mock.patch.object(main, "BATCH_MAX_TOPICS", 10), mock.patch.object(
+            main, "BATCH_MAX_CHARS", 200
+        ):
+            batches = main.group_batches(items)
+
+        self.assertEqual([i for batch in batches for i in batch], list(range(len(items))))
+        for batch in batches:
+            self.assertLessEqual(len(batch), 10)
+            self.assertTrue(len(batch) == 1 or sum(len(items[i][1]) for i in batch) <= 200)
+        self.assertEqual([len(batch) for batch in batches], [10, 10, 6, 2])
+
+    def test_parses_summaries_by_topic_index(self) -> None:
+        items = [("a", "..."), ("b", "..."), ("c", "...")]
+        text = '{"0": " first ", " 2": "third", "1": "", "7": "out of range", "x": "bad", "3": 4}'
+
+        summaries, feedback = summarize_batch(text, items)
+
+        self.assertIsNone(feedback)
+        self.assertEqual(summaries, {0: "first", 2: "third"})
+
+    def test_rejects_non_object_payloads(self) -> None:
+        items = [("a", "...")]
+
+        self.assertEqual(
+            summarize_batch('["first"]', items), ({}, "batch_parse_error: expected a JSON object")
+        )
+        summaries, feedback = summarize_batch("not json", items)
+        self.assertEqual(summaries, {})
+        self.assertTrue(feedback.startswith("batch_parse_error"))
+
+    def test_prompt_carries_every_topic(self) -> None:
+        client = FakeGeminiClient('{"0": "a", "1": "b"}')
+        items = [("新手提问", "时间范围：x\n[...] q"), ("闲聊", "时间范围：x\n[...] gm")]
+
+        asyncio.run(main.get_ai_summaries_batch(client, items, "label", "model", cache_name="cache"))
+
+        prompt = client.calls[0]["contents"]
+        self.assertIn("<<<TOPIC id=0 name=新手提问>>>", prompt)
+        self.assertIn("<<<TOPIC id=1 name=闲聊>>>", prompt)
+        self.assertEqual(client.calls[0]["config"].response_mime_type, "application/json")
+
+
+class FakeTelegramClient:
+    """Records sends and edits; each edit takes edit_seconds."""
+
+    def __init__(self, edit_seconds: float) -> None:
+        self.edit_seconds = edit_seconds
+        self.texts: list[str] = []
+
+    async def send_message(self, peer, text, reply_to=None):
+        self.texts.append(text)
+        return SimpleNamespace(id=1)
+
+    async def edit_message(self, peer, message, text):
+        await asyncio.sleep(self.edit_seconds)
+        self.texts.append(text)
+
+    async def delete_messages(self, peer, ids):
+        pass
+
+
+class StreamedSummaryTest(unittest.TestCase):
+    def stream(self, client: FakeTelegramClient, steps):
+        topic = SimpleNamespace(title="t", top_message=1)
+        streamer = main.StreamedSummary(client, "peer", topic, 3, test_mode=False)
+
+        async def run():
+            for text, pause in steps:
+                streamer.update(text)
+                await asyncio.sleep(pause)
+            started = time.monotonic()
+            delivered = await streamer.finish("final", 3)
+            return delivered, time.monotonic() - started
+
+        with mock.patch.object(main, "STREAM_EDIT_INTERVAL_SECONDS", 0.5):
+            return asyncio.run(run())
+
+    def test_newest_text_wins_and_final_edit_lands_last(self) -> None:
+        client = FakeTelegramClient(edit_seconds=0.05)
+
+        delivered, _ = self.stream(client, [("a", 0.01), ("ab", 0.01), ("abc", 0.6)])
+
+        self.assertTrue(delivered)
+        self.assertEqual([t.splitlines()[-1] for t in client.texts], ["a ▌", "abc ▌", "final"])
+
+    def test_finish_does_not_wait_out_the_edit_interval(self) -> None:
+        # An edit is in flight when finish() runs
+        client = FakeTelegramClient(edit_seconds=0.2)
+
+        delivered, elapsed = self.stream(client, [("a", 0.01), ("ab", 0.6)])
+
+        self.assertTrue(delivered)
+        self.assertLess(elapsed, 0.45)
+
+
+class RateLimiterTest(unittest.TestCase):
+    def test_burst_then_waits_for_refill(self) -> None:
+        async def run():
+            limiter = main.RateLimiter(600)  # 10 per second, burst of 600
+            limiter.tokens = 2
+            started = time.monotonic()
+            for _ in range(3):
+                await limiter.acquire()
+            return time.monotonic() - started
+
+        elapsed = asyncio.run(run())
+        self.assertGreaterEqual(elapsed, 0.08)
+        self.assertLess(elapsed, 0.5)
+
+    def test_backoff_halves_the_rate_and_recovers(self) -> None:
+        limiter = main.RateLimiter(60)
+        limiter.updated = 0.0
+        limiter.refill(0.0)
+
+        with mock.patch.object(main.time, "monotonic", return_value=0.0):
+            limiter.backoff()
+            self.assertAlmostEqual(limiter.rate, 0.5)
+            limiter.backoff()
+        self.assertAlmostEqual(limiter.rate, 0.25)
+        self.assertEqual(limiter.tokens, 0.0)
+
+        limiter.refill(main.RATE_LIMIT_RECOVERY_SECONDS)
+        self.assertEqual(limiter.rate, limiter.max_rate)
+
+    def test_backoff_never_drops_below_the_floor(self) -> None:
+        limiter = main.RateLimiter(60)
+        with mock.patch.object(main.time, "monotonic", return_value=limiter.updated):
+            for _ in range(20):
+                limiter.backoff()
+        self.assertAlmostEqual(limiter.rate, limiter.max_rate * main.RATE_LIMIT_MIN_FRACTION)
+
+    def test_retry_after_holds_calls_without_refilling(self) -> None:
+        limiter = main.RateLimiter(60)
+        limiter.updated = 100.0
+
+        with mock.patch.object(main.time, "monotonic", return_value=100.0):
+            limiter.backoff(retry_after=30)
+        self.assertEqual(limiter.resume_at, 130.0)
+
+        limiter.refill(120.0)  # Still inside the server's wait
+        self.assertEqual(limiter.tokens, 0.0)
+
+    def test_parse_retry_delay(self) -> None:
+        feedback = (
+            "api_error: 429 RESOURCE_EXHAUSTED. {'error': {'code': 429, 'details': "
+            "[{'@type': 'type.googleapis.com/google.rpc.RetryInfo', 'retryDelay': '33s'}]}}"
+        )
+        self.assertTrue(main.is_rate_limited_error(feedback))
+        self.assertEqual(main.parse_retry_delay(feedback), 33.0)
+        self.assertEqual(main.parse_retry_delay('"retryDelay": "1.5s"'), 1.5)
+        self.assertIsNone(main.parse_retry_delay("api_error: 429 RESOURCE_EXHAUSTED"))
+        self.assertIsNone(main.parse_retry_delay(None))
+
+
+if __name__ == "__main__":
+    unittest.main()